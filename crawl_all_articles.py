@@ -4,10 +4,39 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
+from lxml import etree, html as lxml_html
 from datetime import datetime
-from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import configparser
+import queue
+import re
+import requests
+
+
+# Same token pattern as sklearn's CountVectorizer default
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+DATE_XPATH = "//time[@class='c-meta__item c-meta__item--block-at-lg']"
+
+# Precompiled selectors for the article cards on a results page
+SELECT_CARDS = etree.XPath("//div[contains(concat(' ', normalize-space(@class), ' '), ' c-card__body ')]")
+SELECT_DATES = etree.XPath(DATE_XPATH + "/@datetime")
+SELECT_TITLE = etree.XPath(".//a[contains(concat(' ', normalize-space(@class), ' '), ' c-card__link ')]")
+SELECT_AUTHORS = etree.XPath(
+    ".//ul[contains(concat(' ', normalize-space(@class), ' '), ' c-author-list ')]//span[@itemprop='name']"
+)
+SELECT_SUMMARY = etree.XPath(".//div[@data-test='article-description']//p")
+
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+}
+
+
+# Column sizes of the MySQL tables: VARCHAR lengths are in characters, TEXT lengths in bytes
+VARCHAR_MAX_CHARS = 255
+TEXT_MAX_BYTES = 65535
 
 
 def configure_driver():
@@ -50,10 +79,11 @@ def create_database_and_tables():
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS articles (
             id INT AUTO_INCREMENT PRIMARY KEY,
-            title VARCHAR(255) NOT NULL,
+            title VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
             author VARCHAR(255),
             publication_date DATE,
-            abstract TEXT
+            abstract TEXT,
+            UNIQUE KEY uq_title (title)
         )
     """)
 
@@ -64,14 +94,66 @@ def create_database_and_tables():
             article_id INT,
             summary TEXT,
             keywords TEXT,
+            UNIQUE KEY uq_article_id (article_id),
             FOREIGN KEY (article_id) REFERENCES articles(id)
         )
     """)
 
+    # Add the unique keys to tables created before they were part of the schema
+    ensure_unique_keys(cursor)
+    connection.commit()
+
     cursor.close()
     connection.close()
 
 
+def has_index(cursor, table, key_name):
+    """
+    Check whether the table in the current database has an index with the given name.
+    """
+    cursor.execute(
+        """SELECT COUNT(*) FROM information_schema.statistics
+           WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s""",
+        (table, key_name),
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def ensure_unique_keys(cursor):
+    """
+    Add the unique keys on articles.title and article_summaries.article_id if they are missing.
+    Titles are switched to a binary collation so only exact matches count as duplicates, and
+    duplicate rows left by earlier crawls are removed first, keeping the oldest row of each
+    group. Any failure is raised so the crawl never runs without the constraints.
+    """
+    if not has_index(cursor, "articles", "uq_title"):
+        cursor.execute(
+            "ALTER TABLE articles MODIFY title VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL"
+        )
+        cursor.execute("""
+            DELETE article_summaries FROM article_summaries
+            JOIN articles duplicate ON article_summaries.article_id = duplicate.id
+            JOIN articles original ON original.title = duplicate.title AND original.id < duplicate.id
+        """)
+        cursor.execute("""
+            DELETE duplicate FROM articles duplicate
+            JOIN articles original ON original.title = duplicate.title AND original.id < duplicate.id
+        """)
+        print(f"Removed {cursor.rowcount} duplicate articles.")
+        cursor.execute("ALTER TABLE articles ADD UNIQUE KEY uq_title (title)")
+        print("Added unique key uq_title to table articles.")
+
+    if not has_index(cursor, "article_summaries", "uq_article_id"):
+        cursor.execute("""
+            DELETE duplicate FROM article_summaries duplicate
+            JOIN article_summaries original
+                ON original.article_id = duplicate.article_id AND original.id < duplicate.id
+        """)
+        print(f"Removed {cursor.rowcount} duplicate article summaries.")
+        cursor.execute("ALTER TABLE article_summaries ADD UNIQUE KEY uq_article_id (article_id)")
+        print("Added unique key uq_article_id to table article_summaries.")
+
+
 def connect_to_db():
     """
     Connect to the MySQL database using credentials from config.ini.
@@ -90,36 +172,111 @@ def connect_to_db():
     return connection, cursor
 
 
-def insert_article(cursor, title, authors, publication_date, summary):
+def normalize_title(title):
     """
-    Insert an article into the 'articles' table and return its ID.
+    Collapse whitespace in a title and truncate it to the articles.title column,
+    so the stored value matches the staged value it is joined on.
     """
-    query = """
-    INSERT INTO articles (title, author, publication_date, abstract)
-    VALUES (%s, %s, %s, %s)
+    return fit_varchar(" ".join(title.split())).rstrip()
+
+
+def fit_varchar(text, max_chars=VARCHAR_MAX_CHARS):
     """
-    cursor.execute(query, (title, authors, publication_date, summary))
-    return cursor.lastrowid
+    Truncate text to fit a VARCHAR column of max_chars characters.
+    """
+    return text[:max_chars] if text else text
 
 
-def insert_summary(cursor, article_id, summary, keywords):
+def fit_text(text, max_bytes=TEXT_MAX_BYTES):
     """
-    Insert the summary and keywords into the 'article_summaries' table.
+    Truncate text so that its UTF-8 encoding fits a TEXT column of max_bytes bytes.
     """
+    return text.encode("utf-8")[:max_bytes].decode("utf-8", errors="ignore") if text else text
+
+
+def stage_articles(cursor, article_rows):
+    """
+    Load a batch of articles into a per-connection temporary table with one bulk insert.
+    Rows are (title, authors, publication_date, summary, keywords) tuples.
+    """
+    cursor.execute("""
+        CREATE TEMPORARY TABLE IF NOT EXISTS staged_articles (
+            title VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+            author VARCHAR(255),
+            publication_date DATE,
+            abstract TEXT,
+            keywords TEXT
+        )
+    """)
+    cursor.execute("DELETE FROM staged_articles")
     query = """
+    INSERT INTO staged_articles (title, author, publication_date, abstract, keywords)
+    VALUES (%s, %s, %s, %s, %s)
+    """
+    cursor.executemany(query, article_rows)
+
+
+def insert_articles(cursor):
+    """
+    Insert the staged articles into the 'articles' table and return the number of rows inserted.
+    Titles that already exist are left untouched, so re-running the crawler does not create duplicates.
+    """
+    cursor.execute("""
+    INSERT INTO articles (title, author, publication_date, abstract)
+    SELECT title, author, publication_date, abstract FROM staged_articles
+    ON DUPLICATE KEY UPDATE id = articles.id
+    """)
+    return cursor.rowcount
+
+
+def insert_summaries(cursor):
+    """
+    Insert the staged summaries and keywords into the 'article_summaries' table.
+    Each summary is linked to its article by the unique title; articles that already
+    have a summary are skipped. Staged articles without a matching row are logged.
+    """
+    cursor.execute("""
+    SELECT staged_articles.title FROM staged_articles
+    LEFT JOIN articles ON articles.title = staged_articles.title
+    WHERE articles.id IS NULL
+    """)
+    for (title,) in cursor.fetchall():
+        print(f"DEBUG: No article row found for '{title}'; its summary was not stored.")
+
+    cursor.execute("""
     INSERT INTO article_summaries (article_id, summary, keywords)
-    VALUES (%s, %s, %s)
+    SELECT articles.id, staged_articles.abstract, staged_articles.keywords
+    FROM staged_articles
+    JOIN articles ON articles.title = staged_articles.title
+    ON DUPLICATE KEY UPDATE article_id = article_summaries.article_id
+    """)
+
+
+def store_articles(cursor, article_rows):
+    """
+    Store a batch of articles and their summaries with set-based inserts and return
+    the number of articles inserted. On failure the batch is rolled back to a savepoint,
+    so retrying it does not leave partial rows behind.
     """
-    cursor.execute(query, (article_id, summary, keywords))
+    cursor.execute("SAVEPOINT store_articles")
+    try:
+        stage_articles(cursor, article_rows)
+        inserted = insert_articles(cursor)
+        insert_summaries(cursor)
+    except Exception:
+        cursor.execute("ROLLBACK TO SAVEPOINT store_articles")
+        raise
+    return inserted
 
 
 def generate_keywords(summary):
     """
-    Generate keywords from the summary using CountVectorizer.
+    Generate keywords from the summary as its five most frequent non-stop-word tokens.
     """
-    vectorizer = CountVectorizer(max_features=5, stop_words="english")
-    keywords = vectorizer.fit([summary]).get_feature_names_out() if summary else []
-    return ", ".join(keywords)
+    if not summary:
+        return ""
+    tokens = (token for token in TOKEN_PATTERN.findall(summary.lower()) if token not in ENGLISH_STOP_WORDS)
+    return ", ".join(word for word, _ in Counter(tokens).most_common(5))
 
 
 def wait_for_metadata(driver):
@@ -138,84 +295,185 @@ def extract_dates_with_xpath(driver):
     """
     Extract publication dates using a hardcoded XPath.
     """
-    date_xpath = "//time[@class='c-meta__item c-meta__item--block-at-lg']"
-    date_elements = driver.find_elements(By.XPATH, date_xpath)
+    date_elements = driver.find_elements(By.XPATH, DATE_XPATH)
     dates = [elem.get_attribute("datetime") for elem in date_elements if elem.get_attribute("datetime")]
     print(f"DEBUG: Found {len(dates)} dates via XPath.")
     return dates
 
 
-def parse_articles_and_store(soup, dates, cursor, seen_titles):
+def parse_articles_and_store(root, dates, cursor):
     """
-    Parse articles from the page source and store them in the database.
+    Parse articles from the parsed page and store them in the database.
     """
-    articles = soup.find_all("div", class_="c-card__body")
+    articles = SELECT_CARDS(root)
     print(f"DEBUG: Found {len(articles)} articles.")
 
+    article_rows = []
     for i, article in enumerate(articles):
         try:
-            title_tag = article.find("a", class_="c-card__link u-link-inherit")
-            title = title_tag.get_text(strip=True) if title_tag else "No title available"
-
-            if title in seen_titles:
-                print(f"DEBUG: Skipping duplicate article: {title}")
-                continue
-            seen_titles.add(title)
+            title_tags = SELECT_TITLE(article)
+            title = normalize_title(title_tags[0].text_content()) if title_tags else "No title available"
 
-            author_list = article.find("ul", class_="c-author-list")
+            author_tags = SELECT_AUTHORS(article)
             authors = ", ".join(
-                [author.get_text(strip=True) for author in author_list.find_all("span", itemprop="name")]
-            ) if author_list else "No authors available"
+                [author.text_content().strip() for author in author_tags]
+            ) if author_tags else "No authors available"
 
-            summary_div = article.find("div", {"data-test": "article-description"})
-            summary = summary_div.find("p").get_text(strip=True) if summary_div and summary_div.find("p") else "No summary available"
+            summary_tags = SELECT_SUMMARY(article)
+            summary = summary_tags[0].text_content().strip() if summary_tags else "No summary available"
 
             publication_date = dates[i] if i < len(dates) else None
 
-            article_id = insert_article(cursor, title, authors, publication_date, summary)
-            print(f"Inserted article with ID: {article_id} - {title}")
-
-            keywords = generate_keywords(summary)
-            insert_summary(cursor, article_id, summary, keywords)
+            article_rows.append((
+                title,
+                fit_varchar(authors),
+                publication_date,
+                fit_text(summary),
+                fit_text(generate_keywords(summary)),
+            ))
 
         except Exception as e:
             print(f"Error processing article {i + 1}: {e}")
 
+    if not article_rows:
+        return
+
+    try:
+        inserted = store_articles(cursor, article_rows)
+        print(f"Inserted {inserted} new articles.")
+        return
+    except Exception as e:
+        print(f"Error storing page of articles, retrying one at a time: {e}")
+
+    # Retry row by row so a single bad article cannot drop the rest of the page
+    for row in article_rows:
+        try:
+            store_articles(cursor, [row])
+            print(f"Inserted article: {row[0]}")
+        except Exception as e:
+            print(f"Error storing article '{row[0]}': {e}")
+
+
+def build_page_url(page):
+    """
+    Build the Nature.com search URL for the given results page.
+    """
+    url = "https://www.nature.com/search?subject=oncology&article_type=protocols,research,reviews"
+    if page > 1:
+        url += f"&page={page}"
+    return url
+
+
+def fetch_page_without_browser(session, page):
+    """
+    Fetch a results page over plain HTTP and parse it with lxml.
+    Returns the parsed page and its publication dates.
+    Returns None when the request fails, the body cannot be parsed, or the page has no article cards.
+    """
+    print(f"Fetching page {page}...")
+    try:
+        response = session.get(build_page_url(page), timeout=30)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"DEBUG: HTTP fetch failed for page {page}: {e}")
+        return None
+
+    try:
+        root = lxml_html.fromstring(response.content)
+    except etree.LxmlError as e:
+        print(f"DEBUG: Could not parse static HTML for page {page}: {e}")
+        return None
+
+    if not SELECT_CARDS(root):
+        print(f"DEBUG: No articles found in static HTML for page {page}.")
+        return None
+
+    dates = [date for date in SELECT_DATES(root) if date]
+    print(f"DEBUG: Found {len(dates)} dates via XPath.")
+    return root, dates
+
+
+def fetch_page_with_driver(drivers, page):
+    """
+    Fetch a results page with a driver borrowed from the pool.
+    Returns the parsed page and the publication dates found on it, or None if the fetch fails.
+    """
+    driver = drivers.get()
+    try:
+        print(f"Fetching page {page} with Selenium...")
+        driver.get(build_page_url(page))
+        wait_for_metadata(driver)
+        return lxml_html.fromstring(driver.page_source), extract_dates_with_xpath(driver)
+    except Exception as e:
+        print(f"DEBUG: Selenium fetch failed for page {page}: {e}")
+        return None
+    finally:
+        drivers.put(driver)
+
+
+def fetch_pages_with_selenium(pages, num_workers):
+    """
+    Fetch the given pages with a pool of headless drivers.
+    Returns a dict mapping page number to (parsed page, dates), or None for pages that could not be fetched.
+    """
+    num_workers = min(num_workers, len(pages))
+    drivers = queue.Queue()
+    try:
+        for _ in range(num_workers):
+            drivers.put(configure_driver())
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            results = executor.map(lambda page: fetch_page_with_driver(drivers, page), pages)
+            return dict(zip(pages, results))
+    finally:
+        while not drivers.empty():
+            drivers.get().quit()
+
+
+def store_pages(results, cursor):
+    """
+    Parse and store fetched pages in page order, skipping pages that could not be fetched.
+    """
+    for page, result in sorted(results.items()):
+        if result is None:
+            continue
+        root, dates = result
+        parse_articles_and_store(root, dates, cursor)
+
 
 def test_selenium_page_and_store():
     """
     Main function to fetch articles, parse metadata, and store results.
+    Pages are fetched concurrently over plain HTTP and stored first, then headless
+    Chrome is used only for pages whose static HTML has no articles. Parsing and
+    database writes stay on the main thread with a single cursor.
     """
     config = configparser.ConfigParser()
     config.read("config.ini")
     max_pages = int(config["general"]["max_pages_to_crawl"])
+    num_workers = max(1, min(int(config["general"].get("crawl_workers", 8)), max_pages))
+    pages = list(range(1, max_pages + 1))
 
-    base_url = "https://www.nature.com/search"
     create_database_and_tables()
-    driver = configure_driver()
     connection, cursor = connect_to_db()
-    seen_titles = set()
 
     try:
-        for page in range(1, max_pages + 1):
-            print(f"Fetching page {page}...")
-            url = f"{base_url}?subject=oncology&article_type=protocols,research,reviews"
-            if page > 1:
-                url += f"&page={page}"
-
-            driver.get(url)
-            wait_for_metadata(driver)
-
-            soup = BeautifulSoup(driver.page_source, "html.parser")
-            dates = extract_dates_with_xpath(driver)
-
-            parse_articles_and_store(soup, dates, cursor, seen_titles)
+        with requests.Session() as session:
+            session.headers.update(HTTP_HEADERS)
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                results = dict(zip(pages, executor.map(lambda page: fetch_page_without_browser(session, page), pages)))
 
+        # Store and commit the pages fetched over HTTP before starting any browsers
+        store_pages(results, cursor)
         connection.commit()
+
+        fallback_pages = [page for page, result in results.items() if result is None]
+        if fallback_pages:
+            print(f"DEBUG: Falling back to Selenium for pages {fallback_pages}.")
+            store_pages(fetch_pages_with_selenium(fallback_pages, num_workers), cursor)
+            connection.commit()
     except Exception as e:
         print(f"Error during processing: {e}")
     finally:
-        driver.quit()
         cursor.close()
         connection.close()
 
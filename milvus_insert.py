@@ -1,10 +1,43 @@
 from sentence_transformers import SentenceTransformer
 from pymilvus import Collection, connections, CollectionSchema, FieldSchema, DataType, utility
 import mysql.connector
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 import numpy as np
+import torch
 import configparser
 
 
+# Maximum byte lengths of the VARCHAR fields stored alongside each embedding
+TITLE_MAX_LENGTH = 1024
+AUTHOR_MAX_LENGTH = 2048
+ABSTRACT_MAX_LENGTH = 65535
+KEYWORDS_MAX_LENGTH = 1024
+
+# Stored in place of a missing publication date
+NO_PUB_DATE = -1
+
+_MODEL = None
+
+
+def get_model():
+    """
+    Return the shared SentenceTransformer model, loading it on first use.
+    The model runs on the GPU in fp16 when available, otherwise on the CPU,
+    and a warning is printed if only the slow Python tokenizer could be loaded.
+    """
+    global _MODEL
+    if _MODEL is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        _MODEL = SentenceTransformer('all-mpnet-base-v2', device=device)
+        if not _MODEL.tokenizer.is_fast:
+            print("WARNING: Loaded a slow Python tokenizer; install 'tokenizers' to speed up batched encoding.")
+        if device == "cuda":
+            _MODEL.half()
+    return _MODEL
+
+
 def connect_to_mysql():
     """
     Connect to the MySQL database using credentials from config.ini.
@@ -20,25 +53,49 @@ def connect_to_mysql():
     )
 
 
-def fetch_article_data():
+def fetch_article_batches(batch_size=1024):
     """
-    Fetch articles and summaries from the MySQL database.
+    Fetch articles with their keywords and summaries from the MySQL database in batches.
+    Rows are (id, title, author, publication_date, abstract, keywords, summary) tuples.
+    Batches are read with keyset pagination on the article ID, so no result set stays
+    open on the server while the previous batch is being encoded and inserted.
     """
     connection = connect_to_mysql()
     cursor = connection.cursor()
-    cursor.execute("SELECT id, title, abstract FROM articles")
-    articles = cursor.fetchall()
-    cursor.execute("SELECT article_id, summary FROM article_summaries")
-    summaries = {row[0]: row[1] for row in cursor.fetchall()}
-    cursor.close()
-    connection.close()
-    return articles, summaries
+    last_id = 0
+    try:
+        while True:
+            cursor.execute("""SELECT articles.id, articles.title, articles.author, articles.publication_date,
+                              articles.abstract, article_summaries.keywords, article_summaries.summary
+                              FROM (SELECT id, title, author, publication_date, abstract
+                                    FROM articles
+                                    WHERE id > %s
+                                    ORDER BY id
+                                    LIMIT %s) AS articles
+                              LEFT JOIN article_summaries ON articles.id = article_summaries.article_id
+                              ORDER BY articles.id""", (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            yield rows
+    finally:
+        cursor.close()
+        connection.close()
+
+
+_COLLECTION = None
 
 
 def connect_to_milvus():
     """
     Connect to Milvus and ensure the collection has the correct schema.
+    The collection handle is cached so repeated calls reuse the same connection.
     """
+    global _COLLECTION
+    if _COLLECTION is not None:
+        return _COLLECTION
+
     config = configparser.ConfigParser()
     config.read("config.ini")
 
@@ -46,12 +103,18 @@ def connect_to_milvus():
     milvus_port = config["milvus"]["port"]
     collection_name = config["milvus"]["collection_name"]
 
-    connections.connect(host=milvus_host, port=milvus_port)
+    connections.connect(alias="default", host=milvus_host, port=milvus_port)
 
-    # Define schema for the collection with dim=768
+    # Define schema for the collection with fp16 vectors of dim=768 and the article fields
+    # returned by searches, so queries do not need a round trip to MySQL
     fields = [
-        FieldSchema(name="embeddings", dtype=DataType.FLOAT_VECTOR, dim=768, is_primary=False),
-        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False)
+        FieldSchema(name="embeddings", dtype=DataType.FLOAT16_VECTOR, dim=768, is_primary=False),
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
+        FieldSchema(name="title", dtype=DataType.VARCHAR, max_length=TITLE_MAX_LENGTH),
+        FieldSchema(name="author", dtype=DataType.VARCHAR, max_length=AUTHOR_MAX_LENGTH),
+        FieldSchema(name="pub_date", dtype=DataType.INT64),
+        FieldSchema(name="abstract", dtype=DataType.VARCHAR, max_length=ABSTRACT_MAX_LENGTH),
+        FieldSchema(name="keywords", dtype=DataType.VARCHAR, max_length=KEYWORDS_MAX_LENGTH),
     ]
     schema = CollectionSchema(fields, description="Collection for article embeddings")
 
@@ -61,68 +124,159 @@ def connect_to_milvus():
 
         # Validate the schema
         existing_fields = collection.schema.fields
+        if [field.name for field in existing_fields] != [field.name for field in fields]:
+            print("Schema mismatch detected: collection fields differ from the expected schema.")
+            print("Dropping and recreating the collection.")
+
+            utility.drop_collection(collection_name)
+            collection = Collection(name=collection_name, schema=schema, shards_num=4)
+            print(f"Recreated collection: {collection_name}")
+            _COLLECTION = collection
+            return collection
+
         for field in existing_fields:
-            if field.name == "embeddings" and field.params["dim"] != 768:
-                print(f"Schema mismatch detected for field 'embeddings'. Expected dim=768, got dim={field.params['dim']}.")
+            if field.name == "embeddings" and (field.dtype != DataType.FLOAT16_VECTOR or field.params["dim"] != 768):
+                print(
+                    f"Schema mismatch detected for field 'embeddings'. Expected FLOAT16_VECTOR with dim=768, "
+                    f"got {field.dtype.name} with dim={field.params['dim']}."
+                )
                 print("Dropping and recreating the collection.")
                 
                 # Drop and recreate the collection
                 utility.drop_collection(collection_name)
-                collection = Collection(name=collection_name, schema=schema)
+                collection = Collection(name=collection_name, schema=schema, shards_num=4)
                 print(f"Recreated collection: {collection_name}")
+                _COLLECTION = collection
                 return collection
         
         print(f"Connected to existing collection: {collection_name} with correct schema.")
     else:
         # Create the collection if it does not exist
-        collection = Collection(name=collection_name, schema=schema)
+        collection = Collection(name=collection_name, schema=schema, shards_num=4)
         print(f"Created new collection: {collection_name}")
 
+    _COLLECTION = collection
     return collection
 
 
-def combine_embeddings(title_embedding, abstract_embedding, summary_embedding, weights):
+def combine_embeddings(field_embeddings, weights):
     """
-    Combine embeddings from title, abstract, and summary using specified weights.
+    Combine stacked (title, abstract, summary) embeddings of shape (N, 3, dim) using specified weights.
+    The weighted sum and renormalization run on the tensor's device, and the result is
+    copied to the host once as a contiguous fp16 array for inner-product search.
     """
-    return (weights[0] * title_embedding +
-            weights[1] * abstract_embedding +
-            weights[2] * summary_embedding)
+    weights = torch.tensor(weights, device=field_embeddings.device, dtype=field_embeddings.dtype)
+    combined = torch.einsum("nij,i->nj", field_embeddings, weights)
+    combined = torch.nn.functional.normalize(combined, dim=1)
+    return np.ascontiguousarray(combined.to(torch.float16).cpu().numpy())
 
 
-def insert_weighted_embeddings(articles, summaries):
+def encode_articles(model, articles, weights, batch_size=128):
     """
-    Generate weighted embeddings for articles and insert them into Milvus.
+    Encode title, abstract, and summary of every article in a single batched call
+    and return the weighted embeddings with shape (N, dim).
     """
-    model = SentenceTransformer('all-mpnet-base-v2')
-    collection = connect_to_milvus()
+    texts = []
+    for article in articles:
+        title, abstract, summary = article[1], article[4], article[6]
+        texts += [title or "", abstract or "", summary or ""]
+
+    with torch.inference_mode():
+        field_embeddings = model.encode(
+            texts,
+            batch_size=batch_size,
+            show_progress_bar=False,
+            normalize_embeddings=True,
+            convert_to_tensor=True,
+        )
+        return combine_embeddings(field_embeddings.view(len(articles), 3, -1), weights)
+
+
+def truncate_utf8(text, max_length):
+    """
+    Truncate text so that its UTF-8 encoding fits within max_length bytes.
+    """
+    return (text or "").encode("utf-8")[:max_length].decode("utf-8", errors="ignore")
 
-    embeddings = []
-    ids = []
+
+def to_epoch_day(value):
+    """
+    Convert a publication date to days since 1970-01-01, or NO_PUB_DATE when missing.
+    """
+    return (value - date(1970, 1, 1)).days if value else NO_PUB_DATE
+
+
+def build_scalar_columns(articles):
+    """
+    Build the id, title, author, pub_date, abstract, and keywords columns stored with each embedding.
+    """
+    return [
+        [article[0] for article in articles],
+        [truncate_utf8(article[1], TITLE_MAX_LENGTH) for article in articles],
+        [truncate_utf8(article[2], AUTHOR_MAX_LENGTH) for article in articles],
+        [to_epoch_day(article[3]) for article in articles],
+        [truncate_utf8(article[4], ABSTRACT_MAX_LENGTH) for article in articles],
+        [truncate_utf8(article[5], KEYWORDS_MAX_LENGTH) for article in articles],
+    ]
+
+
+def submit_insert(executor, collection, embeddings, articles):
+    """
+    Submit one Milvus insert of the embeddings and the articles' scalar columns to the executor.
+    Returns the future of the submitted insert.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float16)
+    return executor.submit(collection.insert, [list(embeddings)] + build_scalar_columns(articles))
+
+
+def insert_weighted_embeddings(article_batches, insert_batch_size=10000, max_workers=4):
+    """
+    Generate weighted embeddings for batches of articles and insert them into Milvus.
+    Encoded batches are accumulated into inserts of about insert_batch_size rows, which run
+    in the background while the next batch is fetched and encoded; the collection is
+    flushed and compacted once after all batches are written.
+    """
+    model = get_model()
+    collection = connect_to_milvus()
 
     # Weights for title, abstract, and summary embeddings
     weights = [0.5, 0.3, 0.2]
 
-    for article in articles:
-        article_id, title, abstract = article
-        summary = summaries.get(article_id, "")
+    total = 0
+    pending = deque()
+    buffered_embeddings = []
+    buffered_articles = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for articles in article_batches:
+            buffered_embeddings.append(encode_articles(model, articles, weights))
+            buffered_articles.extend(articles)
+            if len(buffered_articles) < insert_batch_size:
+                continue
+
+            pending.append(submit_insert(executor, collection, np.concatenate(buffered_embeddings), buffered_articles))
+            total += len(buffered_articles)
+            buffered_embeddings = []
+            buffered_articles = []
+
+            # Bound the number of inserts held in memory while waiting on Milvus
+            while len(pending) > max_workers:
+                pending.popleft().result()
 
-        # Generate embeddings for each field
-        title_embedding = model.encode(title, normalize_embeddings=True)
-        abstract_embedding = model.encode(abstract, normalize_embeddings=True)
-        summary_embedding = model.encode(summary, normalize_embeddings=True)
+        if buffered_articles:
+            pending.append(submit_insert(executor, collection, np.concatenate(buffered_embeddings), buffered_articles))
+            total += len(buffered_articles)
 
-        # Combine embeddings with weights
-        combined_embedding = combine_embeddings(title_embedding, abstract_embedding, summary_embedding, weights)
+        while pending:
+            pending.popleft().result()
 
-        embeddings.append(combined_embedding)
-        ids.append(article_id)
+    if not total:
+        print("No articles to insert into Milvus.")
+        return
 
-    # Insert embeddings into the collection
-    collection.insert([embeddings, ids])
-    print(f"Inserted {len(ids)} articles into Milvus.")
+    collection.flush()
+    collection.compact()
+    print(f"Inserted {total} articles into Milvus.")
 
 
 if __name__ == "__main__":
-    articles, summaries = fetch_article_data()
-    insert_weighted_embeddings(articles, summaries)
+    insert_weighted_embeddings(fetch_article_batches())
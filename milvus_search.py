@@ -1,36 +1,86 @@
 import csv
 from sentence_transformers import SentenceTransformer
 from pymilvus import connections, Collection, utility
-import mysql.connector
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import re
 import dateparser
 from prettytable import PrettyTable
 import configparser
+import numpy as np
+import torch
 
 
-def connect_to_milvus():
+# Article fields stored in Milvus alongside each embedding, in display order after the ID
+OUTPUT_FIELDS = ["title", "author", "pub_date", "abstract", "keywords"]
+
+RELATIVE_DATE_PATTERN = re.compile(r"(last|past)\s+(\d+)\s+(days|weeks|months)", re.IGNORECASE)
+# Queries without a month name or year cannot contain an absolute date, so dateparser is skipped
+ABSOLUTE_DATE_HINT_PATTERN = re.compile(
+    r"\b(jan(uary)?|feb(ruary)?|mar(ch)?|apr(il)?|may|june?|july?|aug(ust)?|sep(t(ember)?)?|oct(ober)?"
+    r"|nov(ember)?|dec(ember)?)\b|\b\d{4}\b",
+    re.IGNORECASE,
+)
+DATEPARSER_SETTINGS = {"PREFER_DATES_FROM": "past"}
+
+
+_MODEL = None
+
+
+def get_model():
+    """
+    Return the shared SentenceTransformer model, loading it on first use.
+    The model runs on the GPU in fp16 when available, otherwise on the CPU.
     """
-    Connect to Milvus using credentials from config.ini.
+    global _MODEL
+    if _MODEL is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        _MODEL = SentenceTransformer("all-mpnet-base-v2", device=device)
+        if device == "cuda":
+            _MODEL.half()
+    return _MODEL
+
+
+_COLLECTION = None
+
+
+def get_collection():
     """
+    Return the shared Milvus collection handle, connecting on first use.
+    """
+    global _COLLECTION
+    if _COLLECTION is not None:
+        return _COLLECTION
+
     config = configparser.ConfigParser()
     config.read("config.ini")
     milvus_host = config["milvus"]["host"]
     milvus_port = config["milvus"]["port"]
     collection_name = config["milvus"]["collection_name"]
 
-    connections.connect(host=milvus_host, port=milvus_port)
+    connections.connect(alias="default", host=milvus_host, port=milvus_port)
 
     if not utility.has_collection(collection_name):
         raise ValueError(f"Collection '{collection_name}' does not exist in Milvus.")
 
-    collection = Collection(collection_name)
+    _COLLECTION = Collection(collection_name)
+    return _COLLECTION
+
+
+def connect_to_milvus():
+    """
+    Connect to Milvus and make sure the collection is loaded into memory.
+    The collection is only loaded when it is not already resident.
+    """
+    collection = get_collection()
+
+    if utility.load_state(collection.name).name == "Loaded":
+        return collection
 
     try:
         collection.load()
-        print(f"Milvus collection '{collection_name}' loaded into memory.")
+        print(f"Milvus collection '{collection.name}' loaded into memory.")
     except Exception as e:
-        print(f"Failed to load the collection '{collection_name}': {e}")
+        print(f"Failed to load the collection '{collection.name}': {e}")
         raise e
 
     return collection
@@ -38,30 +88,30 @@ def connect_to_milvus():
 
 def create_index_for_collection():
     """
-    Create an index for the Milvus collection if it does not exist.
+    Create an HNSW index for the Milvus collection if it does not exist.
+    An existing index of a different type or metric is dropped and rebuilt.
     """
-    config = configparser.ConfigParser()
-    config.read("config.ini")
-    collection_name = config["milvus"]["collection_name"]
-
-    connections.connect()
-
-    if not utility.has_collection(collection_name):
-        raise ValueError(f"Collection '{collection_name}' does not exist in Milvus.")
-
-    collection = Collection(collection_name)
+    collection = get_collection()
+    collection_name = collection.name
 
     index_params = {
-        "index_type": "IVF_FLAT",
-        "metric_type": "L2",
-        "params": {"nlist": 128},
+        "index_type": "HNSW",
+        "metric_type": "IP",
+        "params": {"M": 16, "efConstruction": 200},
     }
 
     try:
-        # Check if an index already exists
+        # Check if a matching index already exists
         if collection.has_index():
-            print(f"Index already exists for collection '{collection_name}'. Skipping index creation.")
-            return
+            existing_params = collection.index().params
+            if (existing_params.get("index_type") == index_params["index_type"]
+                    and existing_params.get("metric_type") == index_params["metric_type"]):
+                print(f"Index already exists for collection '{collection_name}'. Skipping index creation.")
+                return
+
+            print(f"Replacing {existing_params.get('index_type')} index for collection '{collection_name}'.")
+            collection.release()
+            collection.drop_index()
 
         collection.create_index(field_name="embeddings", index_params=index_params)
         print(f"Index created successfully for collection '{collection_name}'.")
@@ -70,34 +120,20 @@ def create_index_for_collection():
         raise e
 
 
-def connect_to_mysql():
-    """
-    Connect to the MySQL database using credentials from config.ini.
-    """
-    config = configparser.ConfigParser()
-    config.read("config.ini")
-
-    return mysql.connector.connect(
-        host=config["mysql"]["host"],
-        user=config["mysql"]["user"],
-        password=config["mysql"]["password"],
-        database=config["mysql"]["database"]
-    )
-
-
 def parse_date_filter(query):
     """
     Parse date-related queries into a range.
     """
     now = datetime.now()
     date_range = None
+    query_lower = query.lower()
 
-    if "last week" in query.lower():
+    if "last week" in query_lower:
         date_range = (now - timedelta(days=7)).date(), now.date()
-    elif "last month" in query.lower():
+    elif "last month" in query_lower:
         date_range = (now - timedelta(days=30)).date(), now.date()
-    elif "last" in query.lower() or "past" in query.lower():
-        match = re.search(r"(last|past)\s(\d+)\s(days|weeks|months)", query, re.IGNORECASE)
+    elif "last" in query_lower or "past" in query_lower:
+        match = RELATIVE_DATE_PATTERN.search(query)
         if match:
             duration = int(match.group(2))
             unit = match.group(3).lower()
@@ -107,70 +143,93 @@ def parse_date_filter(query):
                 date_range = (now - timedelta(weeks=duration)).date(), now.date()
             elif unit == "months":
                 date_range = (now - timedelta(days=30 * duration)).date(), now.date()
-    else:
-        parsed_date = dateparser.parse(query)
+    elif ABSOLUTE_DATE_HINT_PATTERN.search(query):
+        parsed_date = dateparser.parse(query, languages=["en"], settings=DATEPARSER_SETTINGS)
         if parsed_date:
             date_range = parsed_date.date(), now.date()
 
     return date_range
 
 
-def fetch_filtered_articles_by_ids(ids, date_range=None):
+def build_date_expr(date_range):
     """
-    Fetch articles from MySQL by IDs and optional date range.
+    Build a Milvus filter expression restricting pub_date (days since 1970-01-01) to the date range.
     """
-    if not ids:
-        print("No article IDs to fetch.")
-        return []
+    if not date_range:
+        return None
+    epoch = date(1970, 1, 1)
+    start, end = ((day - epoch).days for day in date_range)
+    return f"pub_date >= {start} && pub_date <= {end}"
 
-    connection = connect_to_mysql()
-    cursor = connection.cursor()
 
-    query = """SELECT articles.id, articles.title, articles.author, articles.publication_date, 
-               articles.abstract, article_summaries.keywords 
-               FROM articles 
-               LEFT JOIN article_summaries ON articles.id = article_summaries.article_id 
-               WHERE articles.id IN (%s)""" % ",".join(["%s"] * len(ids))
-    params = list(ids)
+def hit_to_article(hit):
+    """
+    Convert a Milvus search hit into an (id, title, author, date, abstract, keywords) row.
+    """
+    pub_date = hit.entity.get("pub_date")
+    return (
+        int(hit.id),
+        hit.entity.get("title"),
+        hit.entity.get("author"),
+        date(1970, 1, 1) + timedelta(days=pub_date) if pub_date is not None and pub_date >= 0 else None,
+        hit.entity.get("abstract"),
+        hit.entity.get("keywords"),
+    )
 
-    if date_range:
-        query += " AND articles.publication_date BETWEEN %s AND %s"
-        params.extend(date_range)
 
-    cursor.execute(query, tuple(params))
-    articles = cursor.fetchall()
-    cursor.close()
-    connection.close()
-    return articles
+def search_articles_batch(queries, limit=10, ef=None):
+    """
+    Search articles in Milvus for several free-text queries at once.
+    Queries are encoded in one batch and sent as multi-vector searches; since Milvus
+    applies one filter expression per search, queries are grouped by their date filter.
+    Returns one list of articles per query, in the order of the queries.
+    """
+    if not queries:
+        return []
 
+    model = get_model()
+    with torch.inference_mode():
+        query_embeddings = model.encode(queries, batch_size=64, normalize_embeddings=True, convert_to_tensor=True)
+    query_embeddings = query_embeddings.cpu().numpy().astype(np.float16)
 
-def search_articles(query, nprobe=20, limit=10):
+    collection = connect_to_milvus()
+    search_params = {"metric_type": "IP", "params": {"ef": ef or max(64, limit * 4)}}
+
+    groups = {}
+    for i, query in enumerate(queries):
+        groups.setdefault(build_date_expr(parse_date_filter(query)), []).append(i)
+
+    articles_per_query = [[] for _ in queries]
+    for date_expr, indices in groups.items():
+        try:
+            results = collection.search(
+                data=[query_embeddings[i] for i in indices],
+                anns_field="embeddings",
+                param=search_params,
+                limit=limit,
+                expr=date_expr,
+                output_fields=OUTPUT_FIELDS,
+            )
+        except Exception as e:
+            print(f"Milvus search error: {e}")
+            continue
+
+        for i, hits in zip(indices, results):
+            articles_per_query[i] = [hit_to_article(hit) for hit in hits]
+
+    return articles_per_query
+
+
+def search_articles(query, limit=10, ef=None):
     """
     Search articles in Milvus and filter them based on free-text queries.
+    Article fields are read from Milvus, so no MySQL lookup is needed.
     """
-    model = SentenceTransformer("all-mpnet-base-v2")
-    query_embedding = model.encode([query], normalize_embeddings=True).tolist()
-
-    collection = connect_to_milvus()
-    search_params = {"metric_type": "L2", "params": {"nprobe": nprobe}}
-    try:
-        results = collection.search(
-            data=query_embedding,
-            anns_field="embeddings",
-            param=search_params,
-            limit=limit,
-        )
-        ids = [int(result.id) for result in results[0]]
-        print(f"Milvus returned IDs: {ids}")
-    except Exception as e:
-        print(f"Milvus search error: {e}")
-        return []
-
-    date_range = parse_date_filter(query)
-    articles = fetch_filtered_articles_by_ids(ids, date_range)
+    articles = search_articles_batch([query], limit=limit, ef=ef)[0]
+    print(f"Milvus returned IDs: {[article[0] for article in articles]}")
 
     if not articles:
-        print("No matching articles found in MySQL.")
+        print("No matching articles found in Milvus.")
     return articles
 
 
@@ -202,18 +261,22 @@ def export_to_csv(articles, filename="results.csv"):
         print("No articles to export.")
         return
 
-    with open(filename, mode="w", newline="", encoding="utf-8") as file:
+    rows = [
+        (
+            article[0],
+            article[1],
+            article[2] or "No Authors",
+            article[3] or "No Date",
+            article[4] or "No Summary Available",
+            article[5] or "No Keywords",
+        )
+        for article in articles
+    ]
+
+    with open(filename, mode="w", newline="", encoding="utf-8", buffering=1 << 20) as file:
         writer = csv.writer(file)
         writer.writerow(["ID", "Title", "Authors", "Date", "Abstract", "Keywords"])
-        for article in articles:
-            writer.writerow([
-                article[0],
-                article[1],
-                article[2] or "No Authors",
-                article[3] if article[3] else "No Date",
-                article[4] or "No Summary Available",
-                article[5] or "No Keywords"
-            ])
+        writer.writerows(rows)
     print(f"Results exported to {filename}")
 
 